@@ -19,6 +19,7 @@ import {
   CAP_CENTER_X_M,
   CAP_CENTER_Y_M,
   CAP_EXTENT_M,
+  CAP_GRID,
   HEIGHT_EXAGGERATION,
   buildCapGeometry,
   capCenterLatLon,
@@ -33,6 +34,7 @@ import {
   type PolarHeightField,
 } from '../../../lib/lunar-atlas/southpole'
 import { GLOBE_RADIUS } from '../../../lib/lunar-atlas/textures'
+import samplerFixture from '../../fixtures/lunar-atlas/southpole-sampler.json'
 
 function makeField(
   size: number,
@@ -49,6 +51,43 @@ function makeField(
   return { size, minM, maxM, data }
 }
 
+// Inputs and expected outputs shared with ui/scripts/southpole_sampler.py,
+// the NumPy port of this sampler used by offline layout tools (written by
+// its test_southpole_sampler.py --update). Both samplers must reproduce it.
+type SamplerFixture = {
+  constants: Record<string, number>
+  field: { size: number; minM: number; maxM: number; data: number[] }
+  grids: number[]
+  points: { lat: number[]; lon: number[] }
+  expected: {
+    s: number[]
+    t: number[]
+    fieldM: number[]
+    meshM: Record<string, number[]>
+    radius: number[] // capRadiusAt at CAP_GRID
+  }
+}
+
+function samplerOutputs(
+  field: PolarHeightField,
+  grids: number[],
+  lat: number[],
+  lon: number[]
+): SamplerFixture['expected'] {
+  const st = lat.map((la, i) => latLonToST(la, lon[i]))
+  const meshM: Record<string, number[]> = {}
+  for (const grid of grids) {
+    meshM[grid] = st.map(({ s, t }) => meshHeightMeters(field, grid, s, t))
+  }
+  return {
+    s: st.map((p) => p.s),
+    t: st.map((p) => p.t),
+    fieldM: st.map(({ s, t }) => sampleFieldMeters(field, s, t)),
+    meshM,
+    radius: lat.map((la, i) => capRadiusAt(field, CAP_GRID, la, lon[i])),
+  }
+}
+
 describe('moonbase connecting-ridge terrain', () => {
   describe('polar stereographic projection (off-pole patch center)', () => {
     it('maps the patch center to (0, 0) and back', () => {
@@ -345,4 +384,38 @@ describe('moonbase connecting-ridge terrain', () => {
       expect(stepM).to.be.lessThan(0.005)
     })
   })
+
+  describe('offline sampler conformance (southpole_sampler.py)', () => {
+    const fixture = samplerFixture as SamplerFixture
+
+    it('was recorded with the current BAKED patch constants', () => {
+      expect(fixture.constants.CAP_EXTENT_M).to.equal(CAP_EXTENT_M)
+      expect(fixture.constants.CAP_CENTER_X_M).to.equal(CAP_CENTER_X_M)
+      expect(fixture.constants.CAP_CENTER_Y_M).to.equal(CAP_CENTER_Y_M)
+      expect(fixture.constants.HEIGHT_EXAGGERATION).to.equal(HEIGHT_EXAGGERATION)
+    })
+
+    it('reproduces the recorded projection, texel and mesh-lattice samples', () => {
+      const { field, grids, points, expected } = fixture
+      const got = samplerOutputs(
+        { ...field, data: Uint16Array.from(field.data) },
+        grids,
+        points.lat,
+        points.lon
+      )
+      const close = (a: number[], b: number[], tol: number, label: string) => {
+        expect(a.length, label).to.equal(b.length)
+        a.forEach((v, i) =>
+          expect(Math.abs(v - b[i]), `${label}[${i}]`).to.be.lessThan(tol)
+        )
+      }
+      close(got.s, expected.s, 1e-12, 's')
+      close(got.t, expected.t, 1e-12, 't')
+      close(got.fieldM, expected.fieldM, 1e-9, 'fieldM')
+      for (const grid of grids) {
+        close(got.meshM[grid], expected.meshM[grid], 1e-9, `meshM ${grid}`)
+      }
+      close(got.radius, expected.radius, 1e-12, 'radius')
+    })
+  })
 })
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Benchmark the terrain bake (build-southpole-assets.py) on synthetic DEMs.
+
+The real bake needs the 40 MB PGDA GeoTIFF; this generates deterministic
+fractal DEMs instead, so it runs anywhere (CI included). For each bake size
+N it makes an N/2 px DEM at 5 m/px — the same 2x upsample the real
+3200 px -> 6400 px albedo bake does — and times the bake's public stages:
+
+  encode_height_rg   16-bit RG encode of the N px height field
+  resample           DEM -> N px (area-average down, cubic up)
+  hillshade          N px
+  micro_relief       N px
+  crater_field       N px
+  terrain_analytics  slope/roughness/suitability of the DEM, onto N/4 px
+  bake_albedo        the whole default albedo bake, DEM -> N px
+  tint_and_save      tint + JPEG encode of the N px albedo
+
+Each stage is timed --repeat times and its best time kept. Timings only
+compare on the same machine: save a baseline there, then compare against it.
+
+Usage:
+  python3 bench-southpole-assets.py [--sizes 800 3200 6400] [--repeat 3]
+      [--save baseline.json]      store these results as the baseline
+      [--compare baseline.json]   exit 1 if any stage is slower than the
+                                  baseline by more than --threshold
+                                  (default 0.25 = 25%) and --min-delta seconds
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+def load_bake():
+    """build-southpole-assets.py as a module (its name isn't importable)."""
+    path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'build-southpole-assets.py'
+    )
+    spec = importlib.util.spec_from_file_location('build_southpole_assets', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_dem(size: int, seed: int = 0) -> np.ndarray:
+    """Deterministic fractal terrain (m), float32, with Site01's relief range.
+
+    Power-law (f^-1.6 amplitude) noise: ridges and basins at every scale,
+    so the filters and the hillshade see realistic gradients.
+    """
+    rng = np.random.default_rng(seed)
+    fy = np.fft.fftfreq(size)[:, None]
+    fx = np.fft.rfftfreq(size)[None, :]
+    f = np.hypot(fy, fx)
+    f[0, 0] = 1.0
+    spec = rng.standard_normal(f.shape) + 1j * rng.standard_normal(f.shape)
+    spec /= f**1.6
+    spec[0, 0] = 0.0
+    z = np.fft.irfft2(spec, s=(size, size))
+    z = (z - z.min()) / (z.max() - z.min())
+    return (z * 2480.0 - 520.0).astype(np.float32)
+
+
+def best_time(fn, repeat: int):
+    """(best seconds over repeat calls of fn, fn's last result)."""
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, out
+
+
+def bench_size(bake, size: int, repeat: int, tmp_dir: str) -> dict:
+    """{stage: best seconds} for an N = size px bake."""
+    dem = synthetic_dem(size // 2)
+    px_m = bake.MAP_SCALE_M * dem.shape[0] / size
+    h = bake.resample(dem, size)
+    h_min, h_max = float(dem.min()), float(dem.max())
+    out = {}
+    stages = {
+        'encode_height_rg': lambda: bake.encode_height_rg(h, h_min, h_max),
+        'resample': lambda: bake.resample(dem, size),
+        'hillshade': lambda: bake.hillshade(h, px_m),
+        'micro_relief': lambda: bake.micro_relief(size, px_m, 107),
+        'crater_field': lambda: bake.crater_field(size, px_m, 207),
+        'terrain_analytics': lambda: bake.terrain_analytics(dem, bake.MAP_SCALE_M, 2),
+        'bake_albedo': lambda: bake.bake_albedo(dem, bake.MAP_SCALE_M, size, 7),
+        'tint_and_save': lambda: bake.tint_and_save(
+            out['bake_albedo'], os.path.join(tmp_dir, 'albedo.jpg')
+        ),
+    }
+    results = {}
+    for name, fn in stages.items():
+        t, out[name] = best_time(fn, repeat)
+        results[name] = round(t, 4)
+        print(f'{size:>6}  {name:<18} {results[name]:9.3f} s', flush=True)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta: float) -> list:
+    """Stages slower than baseline by > threshold (relative) and min_delta (s)."""
+    regressions = []
+    for size, stages in results.items():
+        for name, t in stages.items():
+            ref = baseline.get(size, {}).get(name)
+            if ref is None:
+                continue
+            if t > ref * (1.0 + threshold) and t - ref > min_delta:
+                regressions.append(f'{size} px {name}: {ref:.3f} s -> {t:.3f} s')
+    return regressions
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description='Benchmark the terrain bake.')
+    ap.add_argument('--sizes', type=int, nargs='+', default=[800, 3200, 6400])
+    ap.add_argument('--repeat', type=int, default=3, help='best of N runs')
+    ap.add_argument('--save', metavar='PATH', help='write results as a baseline')
+    ap.add_argument('--compare', metavar='PATH', help='baseline to compare against')
+    ap.add_argument(
+        '--threshold',
+        type=float,
+        default=0.25,
+        help='allowed relative slowdown per stage (default 0.25)',
+    )
+    ap.add_argument(
+        '--min-delta',
+        type=float,
+        default=0.01,
+        help='ignore slowdowns smaller than this many seconds (timer noise)',
+    )
+    args = ap.parse_args()
+
+    bake = load_bake()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            results[str(size)] = bench_size(bake, size, args.repeat, tmp_dir)
+
+    report = {
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f'wrote {args.save}')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('cpus') != report['cpus']:
+            print(
+                f"note: baseline ran on {baseline.get('cpus')} CPUs, "
+                f"this run on {report['cpus']}"
+            )
+        regressions = compare(
+            results, baseline['results'], args.threshold, args.min_delta
+        )
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print(f'no stage regressed past {args.threshold:.0%}')
+
+
+if __name__ == '__main__':
+    main()
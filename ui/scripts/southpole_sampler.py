@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Batched terrain height queries that agree with the rendered ridge patch.
+
+A NumPy port of the sampler in ui/lib/lunar-atlas/southpole.ts, for offline
+layout tools that seat thousands of modules and markers at once: the same
+south polar stereographic mapping (latLonToST / stToLatLon), the same
+bilinear texel sampling (sampleFieldMeters) and the same mesh-lattice
+interpolation on the two flat triangles per cell the GPU draws
+(meshHeightMeters), evaluated over whole arrays of points. The lattice node
+heights are sampled once per field, so a query costs a few array ops per
+point (millions of points per second).
+
+Heights come from the baked height_rg.png (exactly what the scene decodes)
+or straight from a DEM GeoTIFF, and the patch constants from southpole.ts
+itself or a southpole-constants.txt the bake wrote, so the two sides can't
+drift apart. ui/cypress/fixtures/lunar-atlas/southpole-sampler.json records
+samples that both this module (test_southpole_sampler.py) and southpole.ts
+(lunar-atlas-southpole.cy.ts) must reproduce.
+
+Usage (as a module):
+  from southpole_sampler import HeightSampler
+  sampler = HeightSampler.from_height_rg('ui/public/moonbase/southpole/height_rg.png')
+  h = sampler.mesh_height_at(lats, lons)          # meters, as rendered
+  r = sampler.radius_at(lats, lons)               # scene units (capRadiusAt)
+
+Or from the shell, lat,lon CSV rows in, lat,lon,s,t,height_m,inside out:
+  python3 southpole_sampler.py height_rg.png [points.csv]
+      [--constants southpole.ts|southpole-constants.txt] [--dem] [--grid N]
+"""
+
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+import tifffile
+from PIL import Image
+
+MOON_RADIUS_M = 1737400.0  # MOON_RADIUS_M in ui/lib/lunar-atlas/geo.ts
+GLOBE_RADIUS = 2.0  # scene units; GLOBE_RADIUS in ui/lib/lunar-atlas/textures.ts
+CAP_GRID = 1024  # cells per side; CAP_GRID in southpole.ts
+
+DEG2RAD = np.pi / 180
+RAD2DEG = 180 / np.pi
+
+SOUTHPOLE_TS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..',
+    'lib',
+    'lunar-atlas',
+    'southpole.ts',
+)
+
+# The BAKED constants the sampler needs, by their southpole.ts names. The
+# bake's southpole-constants.txt spells HEIGHT_EXAGGERATION as EXAGGERATION.
+CONSTANT_NAMES = (
+    'CAP_EXTENT_M',
+    'CAP_CENTER_X_M',
+    'CAP_CENTER_Y_M',
+    'CAP_HEIGHT_MIN_M',
+    'CAP_HEIGHT_MAX_M',
+    'HEIGHT_EXAGGERATION',
+)
+CONSTANT_LINE = re.compile(
+    r'^(?:export const )?(CAP_\w+|HEIGHT_EXAGGERATION|EXAGGERATION)\s*=\s*'
+    r'(-?[\d.]+(?:e-?\d+)?)\s*$',
+    re.MULTILINE,
+)
+
+
+def read_constants(path: str = SOUTHPOLE_TS) -> dict:
+    """{name: value} of the BAKED constants in southpole.ts or a
+    southpole-constants.txt (both are `NAME = value` lines)."""
+    with open(path) as f:
+        found = {m[1]: float(m[2]) for m in CONSTANT_LINE.finditer(f.read())}
+    if 'EXAGGERATION' in found:
+        found.setdefault('HEIGHT_EXAGGERATION', found.pop('EXAGGERATION'))
+    missing = [name for name in CONSTANT_NAMES if name not in found]
+    if missing:
+        raise ValueError(f'{path}: no {", ".join(missing)}')
+    return {name: found[name] for name in CONSTANT_NAMES}
+
+
+def lat_lon_to_st(lat, lon, constants: dict) -> tuple[np.ndarray, np.ndarray]:
+    """latLonToST over arrays: normalized patch coords (s, t)."""
+    colat = (90 + np.clip(np.asarray(lat, dtype=np.float64), -90, 90)) * DEG2RAD
+    rho = 2 * MOON_RADIUS_M * np.tan(colat / 2)
+    lon_rad = np.asarray(lon, dtype=np.float64) * DEG2RAD
+    extent = constants['CAP_EXTENT_M']
+    s = (rho * np.sin(lon_rad) - constants['CAP_CENTER_X_M']) / extent
+    t = (rho * np.cos(lon_rad) - constants['CAP_CENTER_Y_M']) / extent
+    return s, t
+
+
+def st_to_lat_lon(s, t, constants: dict) -> tuple[np.ndarray, np.ndarray]:
+    """stToLatLon over arrays: (lat, lon) degrees."""
+    extent = constants['CAP_EXTENT_M']
+    x = np.asarray(s, dtype=np.float64) * extent + constants['CAP_CENTER_X_M']
+    y = np.asarray(t, dtype=np.float64) * extent + constants['CAP_CENTER_Y_M']
+    colat = 2 * np.arctan(np.hypot(x, y) / (2 * MOON_RADIUS_M))
+    return -90 + colat * RAD2DEG, np.arctan2(x, y) * RAD2DEG
+
+
+def inside_patch(s, t) -> np.ndarray:
+    """isInsideCap, on (s, t)."""
+    return (np.abs(s) <= 0.5) & (np.abs(t) <= 0.5)
+
+
+class HeightSampler:
+    """A decoded height field plus its mesh lattice, queried in bulk.
+
+    data is the square field, row 0 at the top (t = +0.5). With min_m /
+    max_m it holds raw 16-bit values decoded like rawToMeters; without, it
+    is already in meters (a DEM). Points outside the patch clamp to its
+    edges, as in southpole.ts.
+    """
+
+    def __init__(
+        self,
+        data: np.ndarray,
+        constants: dict | None = None,
+        min_m: float | None = None,
+        max_m: float | None = None,
+        grid: int = CAP_GRID,
+    ):
+        assert data.ndim == 2 and data.shape[0] == data.shape[1], data.shape
+        self.data = np.asarray(data, dtype=np.float64)
+        self.size = data.shape[0]
+        self.constants = constants if constants is not None else read_constants()
+        self.min_m = min_m
+        self.max_m = max_m
+        self.grid = grid
+        # meshHeightMeters' node heights: sampleFieldMeters at nodeST.
+        ix = np.arange(grid + 1, dtype=np.float64)
+        self.lattice = self.field_height(
+            (ix / grid - 0.5)[None, :], (0.5 - ix / grid)[:, None]
+        )
+
+    @classmethod
+    def from_height_rg(
+        cls, path: str, constants: dict | None = None, grid: int = CAP_GRID
+    ) -> 'HeightSampler':
+        """The baked height_rg.png (R high byte, G low byte), as the scene
+        decodes it with CAP_HEIGHT_MIN_M / CAP_HEIGHT_MAX_M."""
+        constants = constants if constants is not None else read_constants()
+        rg = np.asarray(Image.open(path).convert('RGB'), dtype=np.uint16)
+        raw = (rg[..., 0] << 8) | rg[..., 1]
+        return cls(
+            raw,
+            constants,
+            constants['CAP_HEIGHT_MIN_M'],
+            constants['CAP_HEIGHT_MAX_M'],
+            grid,
+        )
+
+    @classmethod
+    def from_dem(
+        cls, path: str, constants: dict | None = None, grid: int = CAP_GRID
+    ) -> 'HeightSampler':
+        """A DEM GeoTIFF in meters over the same patch. Unlike the bake, no
+        nodata fill: NaN holes stay NaN."""
+        return cls(tifffile.imread(path), constants, grid=grid)
+
+    def to_meters(self, raw: np.ndarray) -> np.ndarray:
+        if self.min_m is None:
+            return raw
+        return self.min_m + (raw / 65535) * (self.max_m - self.min_m)
+
+    def field_height(self, s, t) -> np.ndarray:
+        """sampleFieldMeters: bilinear texel height (m) at (s, t)."""
+        size = self.size
+        x = (0.5 + np.asarray(s, dtype=np.float64)) * size - 0.5
+        y = (0.5 - np.asarray(t, dtype=np.float64)) * size - 0.5
+        x0 = np.floor(x)
+        y0 = np.floor(y)
+        fx = x - x0
+        fy = y - y0
+        xa = np.clip(x0, 0, size - 1).astype(np.intp)
+        xb = np.clip(x0 + 1, 0, size - 1).astype(np.intp)
+        ya = np.clip(y0, 0, size - 1).astype(np.intp)
+        yb = np.clip(y0 + 1, 0, size - 1).astype(np.intp)
+        d = self.data
+        top = d[ya, xa] * (1 - fx) + d[ya, xb] * fx
+        bottom = d[yb, xa] * (1 - fx) + d[yb, xb] * fx
+        return self.to_meters(top * (1 - fy) + bottom * fy)
+
+    def mesh_height(self, s, t) -> np.ndarray:
+        """meshHeightMeters: height (m) on the rendered triangle at (s, t)."""
+        grid = self.grid
+        gx = (np.asarray(s, dtype=np.float64) + 0.5) * grid
+        gy = (0.5 - np.asarray(t, dtype=np.float64)) * grid
+        x0 = np.floor(gx)
+        y0 = np.floor(gy)
+        fx = gx - x0
+        fy = gy - y0
+        xa = np.clip(x0, 0, grid).astype(np.intp)
+        xb = np.clip(x0 + 1, 0, grid).astype(np.intp)
+        ya = np.clip(y0, 0, grid).astype(np.intp)
+        yb = np.clip(y0 + 1, 0, grid).astype(np.intp)
+        nodes = self.lattice
+        a = nodes[ya, xa]
+        b = nodes[ya, xb]
+        c = nodes[yb, xa]
+        d = nodes[yb, xb]
+        # Triangle (a, c, b) up to the b-c diagonal, (b, c, d) past it.
+        return np.where(
+            fx + fy <= 1,
+            a + (b - a) * fx + (c - a) * fy,
+            d + (c - d) * (1 - fx) + (b - d) * (1 - fy),
+        )
+
+    def mesh_height_at(self, lat, lon) -> np.ndarray:
+        """mesh_height at a lat/lon (degrees)."""
+        return self.mesh_height(*lat_lon_to_st(lat, lon, self.constants))
+
+    def height_to_radius(self, height_m) -> np.ndarray:
+        """heightToRadius: render radius (scene units) of a height (m)."""
+        k = self.constants['HEIGHT_EXAGGERATION']
+        return GLOBE_RADIUS * (1 + (np.asarray(height_m) * k) / MOON_RADIUS_M)
+
+    def radius_at(self, lat, lon) -> np.ndarray:
+        """capRadiusAt: rendered terrain radius (scene units) at a lat/lon."""
+        return self.height_to_radius(self.mesh_height_at(lat, lon))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(
+        description='Rendered terrain heights at lat/lon points on the ridge patch.'
+    )
+    ap.add_argument('field', help='height_rg.png, or a DEM GeoTIFF with --dem')
+    ap.add_argument(
+        'points',
+        nargs='?',
+        default='-',
+        help='CSV of lat,lon rows (degrees; default: stdin)',
+    )
+    ap.add_argument(
+        '--constants',
+        default=SOUTHPOLE_TS,
+        help="southpole.ts or a bake's southpole-constants.txt "
+        "(default: the repo's southpole.ts)",
+    )
+    ap.add_argument('--dem', action='store_true', help='field is a DEM in meters')
+    ap.add_argument('--grid', type=int, default=CAP_GRID, help='mesh cells per side')
+    args = ap.parse_args()
+
+    constants = read_constants(args.constants)
+    load = HeightSampler.from_dem if args.dem else HeightSampler.from_height_rg
+    sampler = load(args.field, constants, args.grid)
+    src = sys.stdin if args.points == '-' else args.points
+    lat, lon = np.loadtxt(src, delimiter=',', ndmin=2, usecols=(0, 1)).T
+    s, t = lat_lon_to_st(lat, lon, constants)
+    out = np.column_stack(
+        [lat, lon, s, t, sampler.mesh_height(s, t), inside_patch(s, t)]
+    )
+    np.savetxt(
+        sys.stdout,
+        out,
+        fmt=('%.8f', '%.8f', '%.6f', '%.6f', '%.3f', '%d'),
+        delimiter=',',
+        header='lat,lon,s,t,height_m,inside',
+        comments='',
+    )
+
+
+if __name__ == '__main__':
+    main()
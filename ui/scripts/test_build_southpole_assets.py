@@ -0,0 +1,262 @@
+"""Regression tests for build-southpole-assets.py's equivalence claims.
+
+The bake's faster paths promise to reproduce slower reference computations
+(to float32 rounding, or bit for bit); these pin that on small synthetic
+fields so a later change can't drift silently.
+
+  python3 -m pytest ui/scripts/test_build_southpole_assets.py
+"""
+
+import hashlib
+import importlib.util
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import tifffile
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_bake():
+    """build-southpole-assets.py as a module (its name isn't importable),
+    registered so its process-pool jobs pickle by reference."""
+    path = os.path.join(SCRIPTS, 'build-southpole-assets.py')
+    spec = importlib.util.spec_from_file_location('build_southpole_assets', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+bake = load_bake()
+
+
+def stamp_one_at_a_time(size, cx, cy, r_px, depth_m) -> np.ndarray:
+    """The original crater_field loop: one crater's window at a time."""
+    h = np.zeros((size, size), dtype=np.float32)
+    for i in range(cx.size):
+        if r_px[i] < 1.1:
+            continue
+        pad = r_px[i] * bake.CRATER_RIM_R
+        x0, x1 = max(int(cx[i] - pad), 0), min(int(np.ceil(cx[i] + pad)), size)
+        y0, y1 = max(int(cy[i] - pad), 0), min(int(np.ceil(cy[i] + pad)), size)
+        if x0 >= x1 or y0 >= y1:
+            continue
+        yy, xx = np.mgrid[y0:y1, x0:x1]
+        r = np.sqrt((xx - cx[i]) ** 2 + (yy - cy[i]) ** 2) / r_px[i]
+        bowl = np.where(r < 1.0, -(1.0 - r * r), 0.0)
+        rim = np.where((r >= 1.0) & (r < 1.4), 0.3 * (1.4 - r) / 0.4, 0.0)
+        h[y0:y1, x0:x1] += ((bowl + rim) * depth_m[i]).astype(np.float32)
+    return h
+
+
+def test_batched_craters_match_the_per_crater_loop():
+    size, px_m, seed = 512, 10.0, 207
+    got = bake.crater_field(size, px_m, seed)
+    rng = np.random.default_rng(seed)
+    n = round(bake.crater_count(size, px_m))
+    craters = bake.crater_population(rng, n, px_m, 0, 0, size, size)
+    ref = stamp_one_at_a_time(size, *craters)
+    assert np.abs(ref).max() > 10  # the field has real bowls in it
+    # Only the summation order of overlapping craters differs.
+    np.testing.assert_allclose(got, ref, rtol=0, atol=1e-5)
+
+
+def synthetic_heights(size: int, seed: int = 0) -> np.ndarray:
+    """Smooth random terrain (m), float32, a few hundred meters of relief."""
+    rng = np.random.default_rng(seed)
+    h = bake.gaussian_filter(rng.normal(size=(size, size)), size / 32)
+    return (h / np.abs(h).max() * 400).astype(np.float32)
+
+
+def test_tiled_bake_is_identical_for_any_workers_tiles_and_strips(tmp_path):
+    h = synthetic_heights(128)
+    size, seed = 256, 7
+
+    def digest(**kwargs) -> str:
+        out = bake.bake_albedo_tiled(h, bake.MAP_SCALE_M, size, seed, **kwargs)
+        return hashlib.sha256(np.ascontiguousarray(out).tobytes()).hexdigest()
+
+    ref = digest(workers=1, tile=128, strip=128)
+    assert digest(workers=2, tile=128, strip=128) == ref
+    assert digest(workers=2, tile=96, strip=64) == ref
+    assert digest(workers=1, tile=96, strip=128, scratch_dir=str(tmp_path)) == ref
+
+
+def test_micro_relief_strips_match_the_octaves_drawn_over_a_box():
+    size, px_m, seed = 200, 2.5, 7
+    micro = np.empty((size, size), dtype=np.float32)
+    with ProcessPoolExecutor(1) as pool:
+        bake.micro_relief_strips(micro, px_m, seed, pool, np.empty_like(micro), 48)
+
+    # The 450 m octave's kernel spans the whole field: every edge reflects.
+    box = (37, 101, 150, 200)
+    ref = np.zeros((64, 50), dtype=np.float32)
+    for k, (wl_m, amp_m) in enumerate(bake.MICRO_OCTAVES):
+        sigma = bake.octave_sigma(wl_m, px_m)
+        n = bake.filtered_noise(seed, bake.MICRO_STREAM + k, sigma, box, size)
+        ref += n / bake.filtered_noise_std(sigma) * amp_m
+    assert np.array_equal(micro[37:101, 150:200], ref)
+
+
+def test_workers_zero_means_one_per_cpu():
+    assert bake.resolve_workers(0) == os.cpu_count()
+    assert bake.resolve_workers(None) == 1
+    assert bake.resolve_workers(3) == 3
+
+
+def test_viewshed_agrees_with_line_of_sight_to_every_pixel():
+    n = 160
+    h = synthetic_heights(n, seed=3) / 15  # slopes up to ~30 degrees at 5 m/px
+    rows, cols = (a.ravel() for a in np.mgrid[:n, :n])
+    over = under = 0
+    for row, col in ((80, 80), (5, 120), (0, 0), (150, 33)):
+        got = bake.viewshed(h, bake.MAP_SCALE_M, row, col, 2.0)
+        ref = bake.line_of_sight(
+            h, bake.MAP_SCALE_M, row, col, 2.0, rows, cols, np.zeros(n * n)
+        ).reshape(n, n)
+        assert (got == ref).mean() > 0.994
+        over += (got & ~ref).sum()
+        under += (~got & ref).sum()
+    # Misses are grazing pixels on either side, not a bias toward visible.
+    assert over <= 2 * under + 10
+
+
+def march_horizon(h: np.ndarray, px_m: float, az_deg: float) -> np.ndarray:
+    """Reference horizon: every pixel's own ray marched one major-axis pixel
+    at a time, interpolated on the minor axis, until it leaves the field."""
+    n = h.shape[0]
+    dcol, drow = np.sin(np.radians(az_deg)), -np.cos(np.radians(az_deg))
+    major = max(abs(dcol), abs(drow))
+    rows, cols = np.mgrid[:n, :n].astype(np.float64)
+    out = np.full((n, n), bake.HORIZON_OPEN_DEG)
+    for t in range(1, 2 * n):
+        s = t / major
+        r, c = rows + drow * s, cols + dcol * s
+        inside = (r > -1e-9) & (r < n - 1 + 1e-9) & (c > -1e-9) & (c < n - 1 + 1e-9)
+        if not inside.any():
+            break
+        r, c = np.clip(r, 0, n - 1), np.clip(c, 0, n - 1)
+        r0 = np.minimum(np.floor(r + 1e-9), n - 2).astype(int)
+        c0 = np.minimum(np.floor(c + 1e-9), n - 2).astype(int)
+        fr, fc = np.clip(r - r0, 0, 1), np.clip(c - c0, 0, 1)
+        hq = (h[r0, c0] * (1 - fr) + h[r0 + 1, c0] * fr) * (1 - fc) + (
+            h[r0, c0 + 1] * (1 - fr) + h[r0 + 1, c0 + 1] * fr
+        ) * fc
+        d = s * px_m
+        elev = np.degrees(np.arctan((hq - h) / d) - d / (2 * bake.MOON_RADIUS_M))
+        out = np.where(inside, np.maximum(out, elev), out)
+    return out
+
+
+def test_horizon_sweep_matches_ray_marching():
+    h = synthetic_heights(96, seed=5).astype(np.float64) / 4
+    for az in (0, 45, 90, 135, 180, 225, 270, 315):
+        got = bake.horizon_sweep(h, 20.0, az)
+        # Up to the float32 hull heights picking between near-equal vertices.
+        np.testing.assert_allclose(got, march_horizon(h, 20.0, az), atol=0.01)
+    for az in (10, 30, 77, 120, 200, 300):
+        got = bake.horizon_sweep(h, 20.0, az)
+        ref = march_horizon(h, 20.0, az)
+        err = got - ref
+        # Every candidate lies on the pixel's own ray: never above the truth,
+        # and open (nothing inside the patch) exactly where the truth is.
+        assert err.max() < 1e-3
+        np.testing.assert_array_equal(
+            got == bake.HORIZON_OPEN_DEG, ref == bake.HORIZON_OPEN_DEG
+        )
+        assert np.percentile(-err, 99) < 0.1
+        assert -err.min() < 10
+
+
+def test_fill_takes_a_nearest_valid_pixel_per_hole():
+    size = 64
+    # Unique heights, so every filled value names the pixel it came from.
+    dem = np.arange(size * size, dtype=np.float32).reshape(size, size)
+    holes = np.zeros((size, size), dtype=bool)
+    holes[:9, :14] = True  # an off-ROI corner
+    holes[20:23, 30:41] = True
+    holes[24:27, 30:33] = True  # one pixel from its neighbour
+    holes[40:52, 10] = True
+    holes[60:, 50:] = True
+    holes[33, 33] = True
+    dem[holes] = np.nan
+    dem.flags.writeable = False  # as a cached memmap comes back
+
+    got = bake.fill_nodata(dem)
+    dist = bake.distance_transform_edt(holes)
+    np.testing.assert_array_equal(got[~holes], dem[~holes])
+    src = got[holes].astype(np.int64)
+    sy, sx = np.divmod(src, size)
+    hy, hx = np.nonzero(holes)
+    assert not holes[sy, sx].any()
+    # Ties may resolve differently than one EDT over the whole DEM, but never
+    # to a farther pixel.
+    np.testing.assert_allclose(np.hypot(sy - hy, sx - hx), dist[holes])
+
+
+def test_window_bake_equals_a_bake_of_the_cropped_dem(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    dem = bake.gaussian_filter(rng.normal(size=(400, 400)), 8) * 8000
+    dem = dem.astype(np.float32)
+    dem[:20, :30] = np.nan
+    dem[150:153, 120:126] = np.nan
+    tifffile.imwrite(tmp_path / 'dem.tif', dem, tile=(64, 64), compression='zlib')
+    for name, value in (
+        ('SITE_PX', 400),
+        ('HEIGHT_OUT', 200),
+        ('ALBEDO_OUT', 800),
+        ('CRATER_PATCH_M', 2000.0),
+    ):
+        monkeypatch.setattr(bake, name, value)
+    window = ('-18000', '-5000', '1000')
+    row0, col0, n = bake.window_pixels(bake.TIE_X, bake.TIE_Y, *map(float, window))
+    outputs = ['--craters', '--mesh', '--minmax']
+
+    def run(*argv):
+        os.makedirs(argv[1])
+        monkeypatch.setattr(sys, 'argv', ['build-southpole-assets.py', *argv])
+        bake.main()
+
+    run(
+        str(tmp_path / 'dem.tif'),
+        str(tmp_path / 'window'),
+        '--window',
+        *window,
+        *outputs
+    )
+    # The same square as its own DEM: tiepoint at its corner, outputs at the
+    # full bake's pitch.
+    tifffile.imwrite(tmp_path / 'crop.tif', dem[row0 : row0 + n, col0 : col0 + n])
+    monkeypatch.setattr(bake, 'TIE_X', bake.TIE_X + col0 * bake.MAP_SCALE_M)
+    monkeypatch.setattr(bake, 'TIE_Y', bake.TIE_Y - row0 * bake.MAP_SCALE_M)
+    monkeypatch.setattr(bake, 'HEIGHT_OUT', 200 * n // 400)
+    monkeypatch.setattr(bake, 'ALBEDO_OUT', 800 * n // 400)
+    run(str(tmp_path / 'crop.tif'), str(tmp_path / 'crop'), *outputs)
+
+    names = sorted(os.listdir(tmp_path / 'window'))
+    assert 'patch_mesh.bin' in names and 'craters.bin' in names
+    assert names == sorted(os.listdir(tmp_path / 'crop'))
+    for name in names:
+        window_bytes = (tmp_path / 'window' / name).read_bytes()
+        assert window_bytes == (tmp_path / 'crop' / name).read_bytes(), name
+
+
+def test_analytics_read_a_tilted_plane_as_smooth_to_the_edge():
+    n, px_m, factor = 96, 5.0, 2
+    yy, xx = np.mgrid[:n, :n] * px_m
+    h = 0.07 * xx - 0.04 * yy + 120.0  # a 4.6 degree tilt
+    slope, rough, suit = bake.terrain_analytics(h, px_m, factor, strip=32)
+    expected = np.degrees(np.arctan(np.hypot(0.07, 0.04)))
+    np.testing.assert_allclose(slope * bake.SLOPE_UNIT_DEG, expected, atol=0.01)
+    assert rough.max() == 0
+    assert (suit == suit[0, 0]).all() and suit[0, 0] > 0
+    # Strips only change where the work is cut, never the result.
+    terrain = synthetic_heights(n, seed=2)
+    for a, b in zip(
+        bake.terrain_analytics(terrain, px_m, factor, strip=10),
+        bake.terrain_analytics(terrain, px_m, factor, strip=n),
+    ):
+        np.testing.assert_array_equal(a, b)
@@ -0,0 +1,172 @@
+"""southpole_sampler.py against the TS sampler in southpole.ts.
+
+ui/cypress/fixtures/lunar-atlas/southpole-sampler.json records a synthetic
+height field, lat/lon points all over the patch (and past its clamped
+edges) and the samples there; lunar-atlas-southpole.cy.ts checks that
+southpole.ts reproduces every value, and this checks the NumPy port does.
+
+  python3 -m pytest ui/scripts/test_southpole_sampler.py
+  python3 ui/scripts/test_southpole_sampler.py --update   rewrite the fixture
+                                                          (after a re-bake)
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from southpole_sampler import (  # noqa: E402
+    CAP_GRID,
+    HeightSampler,
+    inside_patch,
+    lat_lon_to_st,
+    read_constants,
+    st_to_lat_lon,
+)
+
+FIXTURE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..',
+    'cypress',
+    'fixtures',
+    'lunar-atlas',
+    'southpole-sampler.json',
+)
+
+
+def load_fixture() -> dict:
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+def fixture_sampler(fixture: dict, grid: int) -> HeightSampler:
+    field = fixture['field']
+    data = np.array(field['data'], dtype=np.uint16).reshape(field['size'], -1)
+    return HeightSampler(data, fixture['constants'], field['minM'], field['maxM'], grid)
+
+
+def test_projection_matches_ts():
+    fixture = load_fixture()
+    points, expected = fixture['points'], fixture['expected']
+    s, t = lat_lon_to_st(points['lat'], points['lon'], fixture['constants'])
+    np.testing.assert_allclose(s, expected['s'], rtol=0, atol=1e-12)
+    np.testing.assert_allclose(t, expected['t'], rtol=0, atol=1e-12)
+
+
+def test_samples_match_ts():
+    fixture = load_fixture()
+    points, expected = fixture['points'], fixture['expected']
+    s, t = lat_lon_to_st(points['lat'], points['lon'], fixture['constants'])
+    for grid in fixture['grids']:
+        sampler = fixture_sampler(fixture, grid)
+        np.testing.assert_allclose(
+            sampler.field_height(s, t), expected['fieldM'], rtol=0, atol=1e-9
+        )
+        np.testing.assert_allclose(
+            sampler.mesh_height(s, t), expected['meshM'][str(grid)], rtol=0, atol=1e-9
+        )
+    sampler = fixture_sampler(fixture, CAP_GRID)
+    np.testing.assert_allclose(
+        sampler.radius_at(points['lat'], points['lon']),
+        expected['radius'],
+        rtol=0,
+        atol=1e-12,
+    )
+
+
+def test_st_round_trip():
+    constants = load_fixture()['constants']
+    s, t = np.meshgrid(np.linspace(-0.5, 0.5, 41), np.linspace(-0.5, 0.5, 41))
+    back = lat_lon_to_st(*st_to_lat_lon(s, t, constants), constants)
+    np.testing.assert_allclose(back, (s, t), rtol=0, atol=1e-9)
+    assert inside_patch(s, t).all()
+    assert not inside_patch(0.51, 0.0)
+
+
+def test_reads_constants_from_ts_and_bake_output(tmp_path):
+    ts = read_constants()
+    assert ts == load_fixture()['constants'], 'fixture predates the last bake'
+    lines = ['---- constants for ui/lib/lunar-atlas/southpole.ts ----']
+    lines += [f'{name} = {value}' for name, value in ts.items()]
+    lines[-1] = f"EXAGGERATION = {ts['HEIGHT_EXAGGERATION']}"
+    path = tmp_path / 'southpole-constants.txt'
+    path.write_text('\n'.join(lines) + '\n')
+    assert read_constants(str(path)) == ts
+
+
+def test_height_rg_decodes_like_the_scene(tmp_path):
+    fixture = load_fixture()
+    ref = fixture_sampler(fixture, 20)
+    raw = ref.data.astype(np.uint16)
+    rgb = np.stack([raw >> 8, raw & 0xFF, np.zeros_like(raw)], axis=-1)
+    path = tmp_path / 'height_rg.png'
+    Image.fromarray(rgb.astype(np.uint8)).save(path)
+    constants = dict(
+        fixture['constants'],
+        CAP_HEIGHT_MIN_M=fixture['field']['minM'],
+        CAP_HEIGHT_MAX_M=fixture['field']['maxM'],
+    )
+    got = HeightSampler.from_height_rg(str(path), constants, grid=20)
+    np.testing.assert_array_equal(got.lattice, ref.lattice)
+
+
+def fixture_points(grid: int) -> tuple[np.ndarray, np.ndarray]:
+    """Random points over and past the patch, the coarse grid's nodes, and
+    points on its cell diagonals (where the two triangles meet)."""
+    rng = np.random.default_rng(12345)
+    s = [rng.uniform(-0.55, 0.55, 160)]
+    t = [rng.uniform(-0.55, 0.55, 160)]
+    ix, iy = np.meshgrid(np.arange(0, grid + 1, 4), np.arange(0, grid + 1, 5))
+    s.append((ix / grid - 0.5).ravel())
+    t.append((0.5 - iy / grid).ravel())
+    i = np.arange(0, grid, 3)
+    f = rng.random(i.size)
+    s.append((i + f) / grid - 0.5)
+    t.append(0.5 - (i + 1 - f) / grid)
+    return np.concatenate(s), np.concatenate(t)
+
+
+def write_fixture() -> None:
+    """The fixture from this port's outputs, on the current southpole.ts
+    constants; lunar-atlas-southpole.cy.ts then holds southpole.ts to it."""
+    constants = read_constants()
+    size, grids = 48, [20, CAP_GRID]
+    y, x = np.mgrid[:size, :size]
+    data = (x * 41 + y * 17) * 811 % 65536
+    field = {
+        'size': size,
+        'minM': constants['CAP_HEIGHT_MIN_M'],
+        'maxM': constants['CAP_HEIGHT_MAX_M'],
+        'data': data.ravel().tolist(),
+    }
+    lat, lon = st_to_lat_lon(*fixture_points(grids[0]), constants)
+    fixture = {'constants': constants, 'field': field, 'grids': grids}
+    fixture['points'] = {'lat': lat.tolist(), 'lon': lon.tolist()}
+    s, t = lat_lon_to_st(lat, lon, constants)
+    samplers = {grid: fixture_sampler(fixture, grid) for grid in grids}
+    fixture['expected'] = {
+        's': s.tolist(),
+        't': t.tolist(),
+        'fieldM': samplers[grids[0]].field_height(s, t).tolist(),
+        'meshM': {
+            str(grid): sampler.mesh_height(s, t).tolist()
+            for grid, sampler in samplers.items()
+        },
+        'radius': samplers[CAP_GRID].radius_at(lat, lon).tolist(),
+    }
+    os.makedirs(os.path.dirname(FIXTURE), exist_ok=True)
+    with open(FIXTURE, 'w') as f:
+        json.dump(fixture, f)
+        f.write('\n')
+    print(f'wrote {FIXTURE}')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--update']:
+        write_fixture()
+    else:
+        sys.exit(f'usage: {sys.argv[0]} --update')